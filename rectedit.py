@@ -5,11 +5,23 @@ import os
 from abc import ABC
 from abc import abstractmethod
 from collections import OrderedDict
-from collections import defaultdict
 from contextlib import redirect_stdout
 from dataclasses import dataclass
+from functools import lru_cache
+from functools import wraps
+from itertools import chain
 from itertools import tee
 
+try:
+    from itertools import pairwise
+except ImportError:
+    # python < 3.10
+    def pairwise(iterable):
+        # pairwise('ABCDEFG') --> AB BC CD DE EF FG
+        a, b = tee(iterable)
+        next(b, None)
+        return zip(a, b)
+
 with redirect_stdout(open(os.devnull, 'w')):
     import pygame
 
@@ -17,11 +29,16 @@ with redirect_stdout(open(os.devnull, 'w')):
 _button_width_denominator = 5
 # ...to get an appealing, *thick* line width for something inside the rect.
 
-_listeners = defaultdict(list)
+# event type -> {callback: None}, an ordered set for O(1) unsubscribe
+_listeners = {}
+# event types with at least one listener, the only ones allowed on the queue
+_subscribed_types = ()
 
 COMMANDSWITCH = pygame.USEREVENT
 COMMANDBEGIN = pygame.USEREVENT + 1
 
+QUIT_KEYS = frozenset({pygame.K_ESCAPE, pygame.K_q})
+
 RECTPOINTS = OrderedDict([
     ('topleft', 'bottomright'),
     ('midtop', 'midbottom'),
@@ -37,7 +54,7 @@ class RectEditError(Exception):
     pass
 
 
-@dataclass
+@dataclass(frozen=True)
 class Shorthand:
     top: int
     right: int
@@ -45,6 +62,9 @@ class Shorthand:
     left: int
 
 
+_ZERO_SHORTHAND = Shorthand(0, 0, 0, 0)
+
+
 @dataclass
 class Sprite:
     image: pygame.Surface
@@ -68,28 +88,51 @@ class EditRect:
         return options.pop(key, getattr(self, key))
 
     def __init__(self, rect, **options):
-        self.rect = rect
         self.minimum_corner_handle_size = self._popopt(options, 'minimum_corner_handle_size')
         if options:
             raise RectEditError(f'Unknown options {", ".join(options)}.')
+        self.rect = rect
         self.reset_handles()
 
+    @property
+    def rect(self):
+        return self._rect
+
+    @rect.setter
+    def rect(self, rect):
+        self._rect = rect
+        self.invalidate_handles(resized=True)
+
+    @property
+    def handles(self):
+        return self.resize_handles()
+
+    def move_ip(self, dx, dy):
+        "move rect in-place and invalidate the handles"
+        self._rect.move_ip(dx, dy)
+        self.invalidate_handles()
+
+    def invalidate_handles(self, resized=False):
+        """
+        Mark handles for rebuilding. Call after mutating `rect` in-place, with
+        `resized` true if its size changed.
+        """
+        self._handles = None
+        if resized:
+            self._handle_size = handle_size(
+                self._rect, minsize=self.minimum_corner_handle_size)
+
+    def resize_handles(self):
+        "cached handle rects, only rebuilt after the rect changes"
+        if self._handles is None:
+            self.reset_handles()
+        return self._handles
+
     def reset_handles(self):
-        self.handles = []
-        for attrname, rect in iter_rect_handles(self.rect):
+        self._handles = []
+        for attrname, rect in iter_rect_handles(self.rect, self._handle_size):
             setattr(self, f'handle_{attrname}', rect)
-            self.handles.append(rect)
-
-
-class DrawRect:
-
-    def __init__(self, color, rect, width):
-        self.color = color
-        self.rect = rect
-        self.width = width
-
-    def __iter__(self):
-        return iter((self.color, self.rect, self.width))
+            self._handles.append(rect)
 
 
 class Command(ABC):
@@ -108,32 +151,34 @@ class HighlightCommand(Command):
     def __init__(self, parent):
         self.editor = parent
         self.current = None
-        self.handle2drawrect = {}
 
     def begin(self, event):
         listen(pygame.MOUSEMOTION, self.on_mousemotion)
         listen(pygame.MOUSEBUTTONDOWN, self.on_mousebuttondown)
 
     def on_mousemotion(self, event):
-        # XXX: SMELLY
-        # put DrawRect objects in drawing queue when mouse over
-        for editrect in self.editor.editrects:
-            for handle in editrect.handles:
-                handleid = id(handle)
-                if handle.collidepoint(event.pos):
-                    if handleid not in self.handle2drawrect:
-                        self.current = None
-                        drawrect = DrawRect((200,200,10), handle, 1)
-                        self.handle2drawrect[handleid] = drawrect
-                        self.editor.draw_rects.append(drawrect)
-                        self.current = handle
-                # once a collision has been found, can't we delete all other handles?
-                else:
-                    if handleid in self.handle2drawrect:
-                        drawrect = self.handle2drawrect[handleid]
-                        if drawrect in self.editor.draw_rects:
-                            self.editor.draw_rects.remove(drawrect)
-                            del self.handle2drawrect[handleid]
+        # highlight handles under the mouse
+        handles = self.editor.handles()
+        bbox = self.editor.handles_bbox
+        if bbox is not None and bbox.collidepoint(event.pos):
+            # one call into pygame for all the handles
+            point = pygame.Rect(event.pos, (1, 1))
+            indexes = point.collidelistall(handles)
+        else:
+            indexes = []
+        handle_keys = self.editor.handle_keys
+        hits = {handle_keys[index] for index in indexes}
+        highlighted = self.editor.highlighted
+        # redraw handles the mouse entered or left
+        for editrect, index in hits ^ highlighted:
+            self.editor.mark_dirty(editrect.handles[index])
+        highlighted.clear()
+        highlighted.update(hits)
+        # last hit, from the editrect drawn on top when they overlap
+        if indexes:
+            self.current = handles[indexes[-1]]
+        else:
+            self.current = None
 
     def on_mousebuttondown(self, event):
         if self.current:
@@ -158,6 +203,8 @@ class AddEditRectCommand(Command):
         rect.center = world.center
         editrect = EditRect(rect)
         parent.editrects.append(editrect)
+        parent.editrects_changed()
+        parent.mark_dirty(editrect.rect)
 
     def end(self):
         pass
@@ -165,23 +212,31 @@ class AddEditRectCommand(Command):
 
 class MoveRectCommand(Command):
 
-    def begin(self, event):
-        self.rect = event.target
+    def __init__(self, parent):
+        self.editor = parent
+        self.rect = None
+        # listen for good, the callbacks do nothing unless dragging
         listen(pygame.MOUSEBUTTONUP, self.on_mousebuttonup)
         listen(pygame.MOUSEMOTION, self.on_mousemotion)
 
+    def begin(self, event):
+        self.rect = event.target
+
     def on_mousemotion(self, event):
-        dx, dy = event.rel
-        self.rect.x += dx
-        self.rect.y += dy
+        if self.rect is None:
+            return
+        self.editor.mark_dirty(self.rect.rect)
+        self.rect.move_ip(*event.rel)
+        self.editor.editrects_changed()
+        self.editor.mark_dirty(self.rect.rect)
 
     def on_mousebuttonup(self, event):
+        if self.rect is None:
+            return
         self.end()
 
     def end(self):
         self.rect = None
-        unsubscribe(pygame.MOUSEBUTTONUP, self.on_mousebuttonup)
-        unsubscribe(pygame.MOUSEMOTION, self.on_mousemotion)
 
 
 class CommandManager:
@@ -204,6 +259,8 @@ class CommandManager:
 
 class RectEditor:
 
+    highlight_color = (200,200,10)
+
     def __init__(self):
         self.reset()
 
@@ -211,7 +268,12 @@ class RectEditor:
         self.running = False
         self.editrects = []
         self.buttons = []
-        self.draw_rects = []
+        # (editrect, handle index) pairs under the mouse
+        self.highlighted = set()
+        self._dirty = []
+        self._handles = None
+        self._handle_keys = None
+        self._handles_bbox = None
         self.world = None
         self.screen = None
         #
@@ -223,13 +285,19 @@ class RectEditor:
         listen(pygame.MOUSEMOTION, self.on_mousemotion)
         listen(pygame.MOUSEBUTTONDOWN, self.on_mousebuttondown)
         listen(pygame.MOUSEBUTTONUP, self.on_mousebuttonup)
+        # pygame also sends VIDEOEXPOSE with this, listen to one of them
+        listen(pygame.WINDOWEXPOSED, self.on_expose)
 
     def on_quit(self, event):
         self.running = False
 
+    def on_expose(self, event):
+        # window uncovered or restored, only dirty areas are ever updated
+        self.mark_dirty(self.world)
+
     def on_keydown(self, event):
-        if event.key in (pygame.K_ESCAPE, pygame.K_q):
-            pygame.event.post(pygame.event.Event(pygame.QUIT))
+        if event.key in QUIT_KEYS:
+            self.running = False
 
     def on_mousemotion(self, event):
         pass
@@ -248,82 +316,191 @@ class RectEditor:
         self.background = self.screen.copy()
         self.world = self.screen.get_rect()
         self.clock = pygame.time.Clock()
+        _update_subscribed_types()
+        self.mark_dirty(self.world)
 
     def loop(self):
         self.running = True
         while self.running:
-            elapsed = self.clock.tick(60)
-            for event in pygame.event.get():
+            # poll only returns empty handed with something to draw, it sleeps
+            # while idle.
+            for event in coalesce_mousemotion(self.poll()):
                 notify(event)
-            # clear
-            self.screen.blit(self.background, (0,0))
-            # draw rects and buttons
-            for sprite in self.editrects + self.buttons:
-                if hasattr(sprite, 'image'):
-                    self.screen.blit(sprite.image, sprite.rect)
-                else:
-                    pygame.draw.rect(self.screen, (200,200,200), sprite.rect, 1)
-            # draw rects
-            for drawrect in self.draw_rects:
-                pygame.draw.rect(self.screen, *drawrect)
-
-            pygame.display.flip()
+            # only repaint and update what changed
+            if self._dirty:
+                for area in self._dirty:
+                    self.draw(area)
+                pygame.display.update(self._dirty)
+                self._dirty.clear()
+            # cap the frame rate while anything is happening, drawn or not, so
+            # events queue up and are coalesced between frames.
+            self.clock.tick(60)
+
+    def poll(self):
+        """
+        Return the queued events someone is listening for. When there are none
+        and nothing to draw, sleep until there are.
+        """
+        # unsubscribed types are blocked from the queue, see
+        # _update_subscribed_types
+        events = pygame.event.get()
+        while not events and not self._dirty:
+            # idle, nothing to draw until something happens
+            events.append(pygame.event.wait())
+            events.extend(pygame.event.get())
+        return events
+
+    def editrects_changed(self):
+        """
+        Call after adding, removing or moving editrects.
+        """
+        self._handles = None
+        self._handle_keys = None
+        self._handles_bbox = None
+
+    def handles(self):
+        """
+        Cached handle rects of all the editrects.
+        """
+        if self._handles is None:
+            self._handles = []
+            self._handle_keys = []
+            for editrect in self.editrects:
+                for index, handle in enumerate(editrect.handles):
+                    self._handles.append(handle)
+                    self._handle_keys.append((editrect, index))
+            if self._handles:
+                self._handles_bbox = self._handles[0].unionall(self._handles[1:])
+        return self._handles
+
+    @property
+    def handle_keys(self):
+        "(editrect, handle index) pair of each of `handles()`"
+        self.handles()
+        return self._handle_keys
+
+    @property
+    def handles_bbox(self):
+        """
+        Union of `handles()`, for a quick reject before testing each of them.
+        None without editrects.
+        """
+        self.handles()
+        return self._handles_bbox
+
+    def mark_dirty(self, *rects):
+        """
+        Queue areas of the screen for redrawing next frame.
+        """
+        # copy, rects are often moved in-place after this
+        self._dirty.extend(rect.copy() for rect in rects)
+
+    def draw(self, area):
+        """
+        Redraw everything touching `area` of the screen, clipped to it.
+        """
+        self.screen.set_clip(area)
+        # clear
+        self.screen.blit(self.background, area, area)
+        # draw rects and buttons
+        for sprite in chain(self.editrects, self.buttons):
+            if not sprite.rect.colliderect(area):
+                continue
+            if hasattr(sprite, 'image'):
+                self.screen.blit(sprite.image, sprite.rect)
+            else:
+                pygame.draw.rect(self.screen, (200,200,200), sprite.rect, 1)
+        # draw highlighted handles
+        for editrect, index in self.highlighted:
+            handle = editrect.handles[index]
+            if handle.colliderect(area):
+                pygame.draw.rect(self.screen, self.highlight_color, handle, 1)
+        self.screen.set_clip(None)
 
 
 # events
 
 def listen(event_type, callback):
     """
-    Append listener, `callback` for event type `event_type`.
+    Add listener, `callback` for event type `event_type`.
     """
-    _listeners[event_type].append(callback)
+    _listeners.setdefault(event_type, {})[callback] = None
+    _update_subscribed_types()
 
 def notify(event):
     """
     Notify all callback of `event`.
     """
-    for callback in _listeners[event.type]:
+    # copy, callbacks may unsubscribe themselves
+    for callback in tuple(_listeners.get(event.type, ())):
         callback(event)
 
 def unsubscribe(event_type, callback):
-    _listeners[event_type].remove(callback)
+    callbacks = _listeners[event_type]
+    del callbacks[callback]
+    if not callbacks:
+        del _listeners[event_type]
+    _update_subscribed_types()
+
+def coalesce_mousemotion(events):
+    """
+    Collapse each run of consecutive MOUSEMOTION events into one event at the
+    last position with the summed `rel`. Only the last motion in a frame is
+    ever seen, and runs are kept apart so clicks stay in order.
+    """
+    compacted = []
+    run = []
+    for event in events:
+        if event.type == pygame.MOUSEMOTION:
+            run.append(event)
+            continue
+        if run:
+            compacted.append(_merge_mousemotion(run))
+            run = []
+        compacted.append(event)
+    if run:
+        compacted.append(_merge_mousemotion(run))
+    return compacted
+
+def _merge_mousemotion(events):
+    last = events[-1]
+    if len(events) == 1:
+        return last
+    dx = sum(event.rel[0] for event in events)
+    dy = sum(event.rel[1] for event in events)
+    return pygame.event.Event(pygame.MOUSEMOTION, dict(last.dict, rel=(dx, dy)))
+
+def _update_subscribed_types():
+    global _subscribed_types
+    _subscribed_types = tuple(_listeners)
+    # keep everything else out of the queue, once there is one
+    if pygame.display.get_init():
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed(_subscribed_types)
 
 def shorthand(*args):
     # https://developer.mozilla.org/en-US/docs/Web/CSS/Shorthand_properties
-    keys = 'top right bottom left'.split()
-    # XXX: will have to do heavy argument lifting here until we think of a
-    #      better solution.
+    if not args or args[0] is None:
+        return _ZERO_SHORTHAND
+    if len(args) == 1:
+        arg = args[0]
+        if not isinstance(arg, tuple):
+            # 1 1 1 1, the common case
+            return Shorthand(arg, arg, arg, arg)
+        args = arg
     nargs = len(args)
     if nargs == 1:
-        if isinstance(args[0], tuple):
-            args = args[0]
-            nargs = len(args)
-        elif args[0] is None:
-            args = None
-            nargs = 1
-    if nargs > 4:
-        raise RectEditError('Invalid number of arguments')
-    #
-    if args is None:
-        args = (0,) * 4
-    elif nargs == 1:
         # 1 1 1 1
-        args = args * 4
+        return Shorthand(*args * 4)
     elif nargs == 2:
         # 1 2 1 2
-        args = args + args
+        return Shorthand(args[0], args[1], args[0], args[1])
     elif nargs == 3:
         # 1 2 3 2
-        args = args + (args[1],)
-    kwargs = dict(zip(keys, args))
-    shorthand = Shorthand(**kwargs)
-    return shorthand
-
-def pairwise(iterable):
-    # pairwise('ABCDEFG') --> AB BC CD DE EF FG
-    a, b = tee(iterable)
-    next(b, None)
-    return zip(a, b)
+        return Shorthand(args[0], args[1], args[2], args[1])
+    elif nargs == 4:
+        return Shorthand(*args)
+    raise RectEditError('Invalid number of arguments')
 
 def setthisthat(toobj, toattr, fromobj, fromattr):
     setattr(toobj, toattr, getattr(fromobj, fromattr))
@@ -333,10 +510,16 @@ def iter_rect_points(rect):
         point = getattr(rect, attrname)
         yield (attrname, point)
 
-def iter_rect_handles(rect, denom=4, minsize=10):
-    size = min(rect.size) // 4
+def handle_size(rect, denom=4, minsize=10):
+    "side length of the square corner handles of `rect`"
+    size = min(rect.size) // denom
     if size < minsize:
         size = minsize
+    return size
+
+def iter_rect_handles(rect, size=None):
+    if size is None:
+        size = handle_size(rect)
     for attrname, point in iter_rect_points(rect):
         if 'mid' in attrname:
             pass
@@ -358,16 +541,30 @@ def vertical(rects, padding=0):
 def get_image(size, flags=None):
     if flags is None:
         flags = pygame.SRCALPHA
-    return pygame.Surface(size, flags)
+    image = pygame.Surface(size, flags)
+    # match the display's pixel format, if there is one, for faster blits
+    if pygame.display.get_surface() is not None:
+        if flags & pygame.SRCALPHA:
+            image = image.convert_alpha()
+        else:
+            image = image.convert()
+    return image
 
 def draw_border(image, color, width):
     """
     Draw border around image
     """
     widthshorthand = shorthand(width)
+    if (widthshorthand.top == widthshorthand.right
+            == widthshorthand.bottom == widthshorthand.left):
+        # even border, pygame draws all four sides in one call. zero width
+        # means fill to pygame.
+        if widthshorthand.top > 0:
+            pygame.draw.rect(image, color, image.get_rect(), widthshorthand.top)
+        return
     rect = image.get_rect()
     # create four sides as rects
-    rects = list(image.get_rect() for _ in range(4))
+    rects = [rect.copy() for _ in range(4)]
     top, right, bottom, left = rects
     # resize
     top.height = widthshorthand.top
@@ -405,6 +602,26 @@ def draw_cross(image, color, width=1, **kwargs):
     draw_hbar(image, color, width, **kwargs)
     draw_vbar(image, color, width, **kwargs)
 
+def cached_image(func):
+    """
+    Cache images rendered by `func` by its arguments. Returns copies so
+    callers can draw on them without touching the cache. Calls with
+    unhashable arguments are rendered every time.
+    """
+    cached = lru_cache(maxsize=32)(func)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            hash((args, tuple(kwargs.items())))
+        except TypeError:
+            return func(*args, **kwargs)
+        return cached(*args, **kwargs).copy()
+
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
+
+@cached_image
 def render_cross(size, color, linewidth=1, **kwargs):
     "create image and render a cross"
     imagekwargs = kwargs.get('imagekwargs', {})
@@ -415,6 +632,7 @@ def render_cross(size, color, linewidth=1, **kwargs):
     draw_cross(image, color, linewidth, padding=padding)
     return image
 
+@cached_image
 def render_minusbutton(size, color):
     """
     Opinionated minus button renderer
@@ -426,6 +644,7 @@ def render_minusbutton(size, color):
     draw_border(image, color, width=width//2)
     return image
 
+@cached_image
 def render_plusbutton(size, color):
     """
     Opinionated plus button renderer
@@ -463,7 +682,7 @@ def main(argv=None):
     for button in buttons:
         button.rect.left = rectedit.world.left + 10
         button.rect.bottom = rectedit.world.bottom - 10
-        layout_horizontal((sprite.rect for sprite in buttons), 0)
+    layout_horizontal([button.rect for button in buttons], 0)
     #
     rectedit.buttons.extend(buttons)
     #
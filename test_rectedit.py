@@ -0,0 +1,69 @@
+import os
+import unittest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import rectedit
+
+from rectedit import pygame
+
+class TestPoll(unittest.TestCase):
+
+    def setUp(self):
+        rectedit._listeners.clear()
+        pygame.display.init()
+        self.editor = rectedit.RectEditor()
+        self.editor.init()
+        pygame.event.clear()
+
+    def tearDown(self):
+        rectedit._listeners.clear()
+        pygame.display.quit()
+
+    def post(self, event_type, **attrs):
+        pygame.event.post(pygame.event.Event(event_type, **attrs))
+
+    def test_poll_keeps_queue_order(self):
+        self.post(pygame.MOUSEBUTTONDOWN, pos=(0,0), button=1)
+        self.post(pygame.MOUSEMOTION, pos=(1,0), rel=(1,0), buttons=(1,0,0))
+        self.post(pygame.MOUSEBUTTONUP, pos=(1,0), button=1)
+        self.post(pygame.MOUSEMOTION, pos=(2,0), rel=(1,0), buttons=(0,0,0))
+        events = self.editor.poll()
+        self.assertEqual(
+            [event.type for event in events],
+            [
+                pygame.MOUSEBUTTONDOWN,
+                pygame.MOUSEMOTION,
+                pygame.MOUSEBUTTONUP,
+                pygame.MOUSEMOTION,
+            ],
+        )
+
+    def test_unsubscribed_types_are_blocked(self):
+        self.post(pygame.JOYAXISMOTION, joy=0, instance_id=0, axis=0, value=0.0)
+        self.post(pygame.KEYDOWN, key=pygame.K_a, mod=0, unicode='a', scancode=0)
+        events = self.editor.poll()
+        self.assertEqual([event.type for event in events], [pygame.KEYDOWN])
+
+    def test_coalesce_polled_motion_keeps_clicks_in_order(self):
+        self.post(pygame.MOUSEMOTION, pos=(1,0), rel=(1,0), buttons=(0,0,0))
+        self.post(pygame.MOUSEMOTION, pos=(3,0), rel=(2,0), buttons=(0,0,0))
+        self.post(pygame.MOUSEBUTTONDOWN, pos=(3,0), button=1)
+        self.post(pygame.MOUSEMOTION, pos=(3,4), rel=(0,4), buttons=(1,0,0))
+        self.post(pygame.MOUSEBUTTONUP, pos=(3,4), button=1)
+        events = rectedit.coalesce_mousemotion(self.editor.poll())
+        self.assertEqual(
+            [(event.type, event.pos) for event in events],
+            [
+                (pygame.MOUSEMOTION, (3,0)),
+                (pygame.MOUSEBUTTONDOWN, (3,0)),
+                (pygame.MOUSEMOTION, (3,4)),
+                (pygame.MOUSEBUTTONUP, (3,4)),
+            ],
+        )
+        self.assertEqual(events[0].rel, (3,0))
+        self.assertEqual(events[2].rel, (0,4))
+
+
+if __name__ == '__main__':
+    unittest.main()